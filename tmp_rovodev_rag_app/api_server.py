@@ -2,8 +2,12 @@
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
 import tempfile
 import os
 from pathlib import Path
@@ -44,6 +48,7 @@ class QueryResponse(BaseModel):
     answer: str
     sources: List[dict]
     num_sources: int
+    model: Optional[str] = None
 
 class DocumentResponse(BaseModel):
     status: str
@@ -58,14 +63,22 @@ class StatusResponse(BaseModel):
     embedding_model: str
     embedding_dimension: int
     default_collection: str
+    answer_cache: Optional[dict] = None
+    prompt_cache: Optional[dict] = None
+    query_embedding_cache: Optional[dict] = None
+    semantic_result_cache: Optional[dict] = None
 
 # Initialize RAG system
 rag_system = None
 
+# Pool for CPU-bound ingestion work so uploads don't serialize on the event loop
+ingest_pool = None
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize the RAG system on startup."""
-    global rag_system
+    global rag_system, ingest_pool
+    ingest_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
     try:
         rag_system = RAGPipeline()
         logger.info("RAG system initialized successfully")
@@ -73,6 +86,11 @@ async def startup_event():
         logger.error(f"Failed to initialize RAG system: {e}")
         # Continue startup but mark system as unavailable
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if ingest_pool is not None:
+        ingest_pool.shutdown(wait=False)
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
@@ -116,48 +134,56 @@ async def upload_documents(
         raise HTTPException(status_code=503, detail="RAG system not initialized")
     
     collection = collection_name or Config.DEFAULT_COLLECTION
-    results = []
-    
-    for file in files:
-        try:
-            # Validate file type
-            file_extension = Path(file.filename).suffix.lower()
-            if file_extension not in Config.ALLOWED_EXTENSIONS:
-                results.append(DocumentResponse(
-                    status="error",
-                    filename=file.filename,
-                    error=f"Unsupported file type: {file_extension}"
-                ))
-                continue
-            
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-                content = await file.read()
-                tmp_file.write(content)
-                tmp_path = tmp_file.name
-            
-            try:
-                # Process document
-                result = rag_system.ingest_document(tmp_path, collection)
-                results.append(DocumentResponse(
-                    status=result["status"],
-                    filename=result["filename"],
-                    chunks_created=result.get("chunks_created"),
-                    collection=result.get("collection"),
-                    error=result.get("error")
-                ))
-            finally:
-                # Cleanup temporary file
-                os.unlink(tmp_path)
-                
-        except Exception as e:
-            results.append(DocumentResponse(
+
+    # Fan out so N files upload, embed, and upsert concurrently; wall time
+    # approaches max(per_file) instead of sum(per_file)
+    tasks = [
+        asyncio.create_task(_process_one_upload(file, collection))
+        for file in files
+    ]
+    return list(await asyncio.gather(*tasks))
+
+async def _process_one_upload(file: UploadFile, collection: str) -> DocumentResponse:
+    """Save one uploaded file to a temp path and ingest it off the event loop."""
+    try:
+        # Validate file type
+        file_extension = Path(file.filename).suffix.lower()
+        if file_extension not in Config.ALLOWED_EXTENSIONS:
+            return DocumentResponse(
                 status="error",
                 filename=file.filename,
-                error=str(e)
-            ))
-    
-    return results
+                error=f"Unsupported file type: {file_extension}"
+            )
+
+        # Spool the upload in memory (spilling to disk past 8MB) in 64KB
+        # blocks; small documents never touch the filesystem since all the
+        # extractors accept file objects
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as tmp_file:
+            while chunk := await file.read(65536):
+                tmp_file.write(chunk)
+            tmp_file.seek(0)
+
+            # Process document in the ingest pool; the CPU-bound embedding
+            # work must not block other requests on the event loop
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                ingest_pool, rag_system.ingest_stream, tmp_file,
+                file.filename, collection
+            )
+        return DocumentResponse(
+            status=result["status"],
+            filename=result["filename"],
+            chunks_created=result.get("chunks_created"),
+            collection=result.get("collection"),
+            error=result.get("error")
+        )
+
+    except Exception as e:
+        return DocumentResponse(
+            status="error",
+            filename=file.filename,
+            error=str(e)
+        )
 
 @app.post("/query", response_model=QueryResponse)
 async def query_documents(request: QueryRequest):
@@ -166,17 +192,37 @@ async def query_documents(request: QueryRequest):
         raise HTTPException(status_code=503, detail="RAG system not initialized")
     
     try:
-        result = rag_system.query(
+        result = await rag_system.aquery(
             request.question,
             request.collection_name,
             request.top_k
         )
-        
+
         return QueryResponse(**result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
 
+@app.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Query documents with a question, streaming the answer as SSE events.
+
+    Each answer chunk is sent as a `data: {json}` event as soon as Gemini
+    produces it; a final event carries the sources.
+    """
+    if rag_system is None:
+        raise HTTPException(status_code=503, detail="RAG system not initialized")
+
+    async def event_stream():
+        async for event in rag_system.aquery_stream(
+            request.question,
+            request.collection_name,
+            request.top_k
+        ):
+            yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.get("/collections")
 async def list_collections():
     """List all available collections."""
@@ -22,6 +22,9 @@ class Config:
     # Gemini Settings (Google AI)
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    # Cheaper/faster model used for simple factual questions (see
+    # AnswerGenerator.route)
+    GEMINI_LITE_MODEL = os.getenv("GEMINI_LITE_MODEL", "gemini-2.5-flash-lite")
     
     # Ollama Settings (local AI)
     OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
@@ -39,6 +42,13 @@ class Config:
     # Retrieval Settings
     TOP_K_DOCUMENTS = 5
     SIMILARITY_THRESHOLD = 0.3
+
+    # Token budget for the combined context passed to the LLM; overlapping
+    # chunks are deduplicated and the remainder trimmed to this many tokens
+    MAX_CONTEXT_TOKENS = 3000
+
+    # Minimum cosine similarity for a cached result to answer a new query
+    SEMANTIC_CACHE_THRESHOLD = 0.95
     
     # Collection/Index Names
     DEFAULT_COLLECTION = "documents"
@@ -2,10 +2,12 @@
 
 import os
 import hashlib
-from typing import List, Dict, Any
+from typing import Any, BinaryIO, Dict, List, Optional
 import logging
 from pathlib import Path
 
+import numpy as np
+
 try:
     import PyPDF2
 except ImportError:
@@ -16,149 +18,248 @@ try:
 except ImportError:
     docx = None
 
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
 import tiktoken
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Loaded once per process: each get_encoding call parses a ~1MB BPE vocab
+_ENC = tiktoken.get_encoding("cl100k_base")  # GPT tokenizer
+
+def _hash_document(data: bytes) -> str:
+    """Content hash for a document.
+
+    BLAKE3 (SIMD, multithreaded) when available, otherwise SHA-256 which
+    CPython dispatches to SHA-NI hardware on modern x86 — both several times
+    faster than the MD5 previously used here.
+    """
+    if blake3 is not None:
+        return blake3(data).hexdigest()
+    return hashlib.sha256(data).hexdigest()
+
 class DocumentProcessor:
     """Handles document loading, chunking, and preprocessing."""
+
+    def __init__(self, chunk_size: Optional[int] = None,
+                 chunk_overlap: Optional[int] = None) -> None:
+        self.chunk_size: int = chunk_size or Config.CHUNK_SIZE
+        self.chunk_overlap: int = chunk_overlap or Config.CHUNK_OVERLAP
+        self.tokenizer = _ENC
     
-    def __init__(self, chunk_size: int = None, chunk_overlap: int = None):
-        self.chunk_size = chunk_size or Config.CHUNK_SIZE
-        self.chunk_overlap = chunk_overlap or Config.CHUNK_OVERLAP
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")  # GPT tokenizer
-    
-    def load_document(self, file_path: str) -> Dict[str, Any]:
-        """Load a document and extract text content."""
-        file_path = Path(file_path)
-        
-        if not file_path.exists():
-            raise FileNotFoundError(f"File not found: {file_path}")
-        
+    def load_document(self, file_path: str, tokenize: bool = True) -> Dict[str, Any]:
+        """Load a document and extract text content.
+
+        Pass tokenize=False to skip the BPE pass when the caller only needs
+        the text and metadata; size_tokens is then the standard len/4
+        approximation and "tokens" is None.
+        """
+        path = Path(file_path)
+
+        if not path.exists():
+            raise FileNotFoundError(f"File not found: {path}")
+
         # Check file size
-        file_size_mb = file_path.stat().st_size / (1024 * 1024)
+        file_size_mb = path.stat().st_size / (1024 * 1024)
         if file_size_mb > Config.MAX_DOCUMENT_SIZE_MB:
             raise ValueError(f"File too large: {file_size_mb:.1f}MB > {Config.MAX_DOCUMENT_SIZE_MB}MB")
-        
+
         # Extract text based on file type
-        extension = file_path.suffix.lower()
-        
+        extension = path.suffix.lower()
+
         if extension == ".txt" or extension == ".md":
-            text = self._load_text_file(file_path)
+            text = self._load_text_file(path)
         elif extension == ".pdf":
-            text = self._load_pdf_file(file_path)
+            text = self._load_pdf_file(path)
         elif extension == ".docx":
-            text = self._load_docx_file(file_path)
+            text = self._load_docx_file(path)
         else:
             raise ValueError(f"Unsupported file type: {extension}")
-        
-        # Generate document metadata
-        doc_hash = hashlib.md5(text.encode()).hexdigest()
-        
+
+        return self._build_doc_data(text, path.name, str(path), extension,
+                                    tokenize=tokenize)
+
+    def load_file(self, fileobj: BinaryIO, filename: str,
+                  tokenize: bool = True) -> Dict[str, Any]:
+        """Load a document from an open binary file object.
+
+        Skips the disk round-trip entirely for callers that already hold the
+        bytes in memory (uploads).
+        """
+        # Same size cap the path-based loader enforces; both upload
+        # surfaces come through here now
+        fileobj.seek(0, os.SEEK_END)
+        file_size_mb = fileobj.tell() / (1024 * 1024)
+        fileobj.seek(0)
+        if file_size_mb > Config.MAX_DOCUMENT_SIZE_MB:
+            raise ValueError(f"File too large: {file_size_mb:.1f}MB > {Config.MAX_DOCUMENT_SIZE_MB}MB")
+
+        extension = Path(filename).suffix.lower()
+
+        if extension == ".txt" or extension == ".md":
+            text = self._decode_text(fileobj.read(), filename)
+        elif extension == ".pdf":
+            text = self._read_pdf(fileobj)
+        elif extension == ".docx":
+            text = self._read_docx(fileobj)
+        else:
+            raise ValueError(f"Unsupported file type: {extension}")
+
+        return self._build_doc_data(text, Path(filename).name, filename, extension,
+                                    tokenize=tokenize)
+
+    def _build_doc_data(self, text: str, filename: str, filepath: str,
+                        extension: str, tokenize: bool = True) -> Dict[str, Any]:
+        """Assemble the loaded-document dict shared by both load paths."""
+        doc_hash = _hash_document(text.encode("utf-8", "ignore"))
+
+        if tokenize:
+            # Tokenize once here and hand the token list to chunk_text so the
+            # document is only BPE-encoded a single time
+            tokens = self.tokenizer.encode(text)
+            size_tokens = len(tokens)
+        else:
+            # ~4 chars per BPE token; exact counting is a multi-hundred-ms
+            # pass on large documents and rarely consumed
+            tokens = None
+            size_tokens = len(text) // 4
+
         return {
-            "filename": file_path.name,
-            "filepath": str(file_path),
+            "filename": filename,
+            "filepath": filepath,
             "extension": extension,
             "text": text,
+            "tokens": tokens,
             "hash": doc_hash,
             "size_chars": len(text),
-            "size_tokens": len(self.tokenizer.encode(text))
+            "size_tokens": size_tokens
         }
     
+    def _decode_text(self, raw: bytes, name: str) -> str:
+        """Decode raw text bytes, trying the usual encodings."""
+        for encoding in ['utf-8', 'latin-1', 'cp1252']:
+            try:
+                return raw.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        raise ValueError(f"Could not decode file: {name}")
+
     def _load_text_file(self, file_path: Path) -> str:
         """Load plain text file."""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            # Try different encodings
-            for encoding in ['latin-1', 'cp1252']:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        return f.read()
-                except UnicodeDecodeError:
-                    continue
-            raise ValueError(f"Could not decode file: {file_path}")
-    
-    def _load_pdf_file(self, file_path: Path) -> str:
-        """Load PDF file and extract text."""
+        with open(file_path, 'rb') as f:
+            return self._decode_text(f.read(), str(file_path))
+
+    def _read_pdf(self, fileobj: BinaryIO) -> str:
+        """Extract text from an open PDF file object."""
         if PyPDF2 is None:
             raise ImportError("PyPDF2 not installed. Install with: pip install PyPDF2")
-        
-        text = ""
+
         try:
-            with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
+            pdf_reader = PyPDF2.PdfReader(fileobj)
+            # Accumulate into a list and join once: += on a string in a
+            # loop goes quadratic on large PDFs
+            parts = []
+            for page in pdf_reader.pages:
+                parts.append(page.extract_text())
+                parts.append("\n")
+            text = "".join(parts)
         except Exception as e:
             raise ValueError(f"Failed to read PDF: {e}")
-        
+
         return text.strip()
-    
-    def _load_docx_file(self, file_path: Path) -> str:
-        """Load DOCX file and extract text."""
+
+    def _load_pdf_file(self, file_path: Path) -> str:
+        """Load PDF file and extract text."""
+        with open(file_path, 'rb') as f:
+            return self._read_pdf(f)
+
+    def _read_docx(self, fileobj: BinaryIO) -> str:
+        """Extract text from an open DOCX file object."""
         if docx is None:
             raise ImportError("python-docx not installed. Install with: pip install python-docx")
-        
+
         try:
-            doc = docx.Document(file_path)
-            text = ""
+            doc = docx.Document(fileobj)
+            parts = []
             for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
+                parts.append(paragraph.text)
+                parts.append("\n")
+            text = "".join(parts)
         except Exception as e:
             raise ValueError(f"Failed to read DOCX: {e}")
-        
+
         return text.strip()
+
+    def _load_docx_file(self, file_path: Path) -> str:
+        """Load DOCX file and extract text."""
+        with open(file_path, 'rb') as f:
+            return self._read_docx(f)
     
-    def chunk_text(self, text: str, metadata: Dict = None) -> List[Dict[str, Any]]:
-        """Split text into chunks with overlap."""
+    def chunk_text(self, text: str, metadata: Optional[Dict[str, Any]] = None,
+                   tokens: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """Split text into chunks with overlap.
+
+        Accepts pre-tokenized input so callers that already encoded the text
+        (load_document) don't pay a second BPE pass.
+        """
         if metadata is None:
             metadata = {}
-        
-        # Tokenize the text
-        tokens = self.tokenizer.encode(text)
-        
-        chunks = []
-        start_idx = 0
-        
-        while start_idx < len(tokens):
-            # Get chunk tokens
-            end_idx = min(start_idx + self.chunk_size, len(tokens))
-            chunk_tokens = tokens[start_idx:end_idx]
-            
-            # Decode back to text
-            chunk_text = self.tokenizer.decode(chunk_tokens)
-            
-            # Create chunk metadata
-            chunk_metadata = {
-                **metadata,
-                "chunk_index": len(chunks),
-                "start_token": start_idx,
-                "end_token": end_idx,
-                "chunk_size": len(chunk_tokens),
-                "chunk_chars": len(chunk_text)
-            }
-            
-            chunks.append({
+
+        # Tokenize the text unless the caller already did
+        if tokens is None:
+            tokens = self.tokenizer.encode(text)
+
+        n = len(tokens)
+        if n == 0:
+            return []
+
+        # Precompute all chunk boundaries at once instead of a Python loop,
+        # then decode every chunk in a single batched call
+        stride = self.chunk_size - self.chunk_overlap
+        starts = np.arange(0, n, stride)
+        ends = np.minimum(starts + self.chunk_size, n)
+        # The loop form stops once a chunk reaches the end of the document;
+        # drop any windows arange generates past that point
+        keep = np.ones(len(starts), dtype=bool)
+        keep[1:] = starts[:-1] + self.chunk_size < n
+        starts, ends = starts[keep], ends[keep]
+
+        chunk_token_lists = [tokens[s:e] for s, e in zip(starts, ends)]
+        chunk_texts = self.tokenizer.decode_batch(chunk_token_lists)
+
+        chunks = [
+            {
                 "text": chunk_text,
-                "metadata": chunk_metadata
-            })
-            
-            # Move to next chunk with overlap
-            if end_idx >= len(tokens):
-                break
-            start_idx = end_idx - self.chunk_overlap
-        
+                "metadata": {
+                    **metadata,
+                    "chunk_index": i,
+                    "start_token": int(start),
+                    "end_token": int(end),
+                    "chunk_size": int(end - start),
+                    "chunk_chars": len(chunk_text)
+                }
+            }
+            for i, (start, end, chunk_text)
+            in enumerate(zip(starts, ends, chunk_texts))
+        ]
+
         logger.info(f"Split text into {len(chunks)} chunks")
         return chunks
     
+    def process_file(self, fileobj: BinaryIO, filename: str) -> List[Dict[str, Any]]:
+        """Complete processing pipeline for an in-memory file object."""
+        return self._process(self.load_file(fileobj, filename))
+
     def process_document(self, file_path: str) -> List[Dict[str, Any]]:
         """Complete document processing pipeline."""
-        # Load document
-        doc_data = self.load_document(file_path)
-        
+        return self._process(self.load_document(file_path))
+
+    def _process(self, doc_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Chunk a loaded document with its base metadata."""
         # Create base metadata
         base_metadata = {
             "filename": doc_data["filename"],
@@ -169,8 +270,9 @@ class DocumentProcessor:
             "total_tokens": doc_data["size_tokens"]
         }
         
-        # Chunk the document
-        chunks = self.chunk_text(doc_data["text"], base_metadata)
+        # Chunk the document, reusing the tokens from load_document
+        chunks = self.chunk_text(doc_data["text"], base_metadata,
+                                 tokens=doc_data["tokens"])
         
         logger.info(f"Processed document '{doc_data['filename']}' into {len(chunks)} chunks")
         return chunks
\ No newline at end of file
@@ -3,6 +3,8 @@
 import numpy as np
 from typing import List, Union
 import logging
+import os
+import torch
 from sentence_transformers import SentenceTransformer
 from config import Config
 
@@ -15,47 +17,91 @@ class EmbeddingService:
         self.model_name = model_name or Config.EMBEDDING_MODEL
         self.model = None
         self.dimension = Config.EMBEDDING_DIMENSION
+        self.batch_size = 32
         self._load_model()
     
     def _load_model(self):
-        """Load the embedding model."""
+        """Load the embedding model, reduced-precision for the device.
+
+        FP16 on GPU halves memory bandwidth and doubles ALU throughput;
+        dynamic int8 quantization of the Linear layers on CPU exploits VNNI
+        where available. The output embeddings stay float32 either way.
+        """
         try:
             logger.info(f"Loading embedding model: {self.model_name}")
-            self.model = SentenceTransformer(self.model_name)
-            
-            # Get actual dimension from model
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            self.model = SentenceTransformer(self.model_name, device=device)
+
+            if device == "cuda":
+                self.model.half()
+            else:
+                try:
+                    from torch.ao.quantization import quantize_dynamic
+                    self.model[0].auto_model = quantize_dynamic(
+                        self.model[0].auto_model, {torch.nn.Linear},
+                        dtype=torch.qint8
+                    )
+                    logger.info("Applied int8 dynamic quantization for CPU inference")
+                except Exception as e:
+                    logger.warning(f"int8 quantization unavailable, using FP32: {e}")
+
+            if device == "cpu":
+                # Leave cores for the web workers instead of letting torch
+                # oversubscribe the machine
+                torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+
+            # Get actual dimension from model (unchanged by quantization)
             test_embedding = self.model.encode("test")
             self.dimension = len(test_embedding)
-            
-            logger.info(f"Model loaded successfully. Dimension: {self.dimension}")
+
+            # Warm up at representative batch sizes so the first real query
+            # doesn't pay kernel JIT/autotune cost, and pin a batch size that
+            # keeps the device busy (GPU starves at 32; CPU thrashes there)
+            for bs in (1, 8, 32, 128):
+                self.model.encode(["warmup"] * bs)
+            self.batch_size = 128 if device == "cuda" else 16
+
+            logger.info(f"Model loaded successfully on {device}. "
+                        f"Dimension: {self.dimension}, batch_size: {self.batch_size}")
         except Exception as e:
             logger.error(f"Failed to load embedding model: {e}")
             raise
     
-    def encode_text(self, text: str) -> List[float]:
-        """Encode a single text string to embedding vector."""
+    def encode_text(self, text: str) -> np.ndarray:
+        """Encode a single text string to a float32 embedding vector.
+
+        Returns the ndarray directly — converting to a Python list inflates
+        each float to a full PyObject; serialization happens at the vector
+        store boundary instead.
+        """
         if self.model is None:
             raise RuntimeError("Embedding model not loaded")
-        
+
         try:
-            embedding = self.model.encode(text)
-            return embedding.tolist()
+            embedding = self.model.encode(text, convert_to_numpy=True,
+                                          normalize_embeddings=True)
+            return np.asarray(embedding, dtype=np.float32)
         except Exception as e:
             logger.error(f"Failed to encode text: {e}")
             raise
-    
-    def encode_batch(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
-        """Encode multiple texts in batches."""
+
+    def encode_batch(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        """Encode multiple texts in batches to a (N, dim) float32 array.
+
+        batch_size defaults to the device-tuned value picked at load time.
+        """
         if self.model is None:
             raise RuntimeError("Embedding model not loaded")
-        
+
         try:
             embeddings = self.model.encode(
-                texts, 
-                batch_size=batch_size,
+                texts,
+                batch_size=batch_size or self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
                 show_progress_bar=len(texts) > 10
             )
-            return embeddings.tolist()
+            return np.asarray(embeddings, dtype=np.float32)
         except Exception as e:
             logger.error(f"Failed to encode batch: {e}")
             raise
@@ -1,11 +1,27 @@
 """Complete RAG pipeline implementation."""
 
+import asyncio
+import functools
 import os
 import json
-from typing import List, Dict, Any, Optional
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, List, Dict, Any, Optional, Tuple
 import logging
 from pathlib import Path
 
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from config import Config
 from vector_store import EndeeVectorStore
 from document_processor import DocumentProcessor
@@ -15,6 +31,120 @@ from simple_text_answer import SimpleTextAnswerer
 
 logger = logging.getLogger(__name__)
 
+# orjson's C parser/serializer is several times faster than stdlib json on
+# the metadata records; both helpers work on bytes so files open in binary
+def _json_loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _json_dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+def _load_best_cos():
+    """Compile the fused similarity-argmax kernel, if numba is installed.
+
+    One pass over the cache matrix with no intermediate sims array;
+    cache=True persists the compiled artifact so later processes skip the
+    JIT warmup. Returns None when numba is absent — callers fall back to
+    the BLAS matvec + argmax pair. numba stays an optional extra and is
+    deliberately not in requirements.txt.
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+
+    @njit(cache=True, fastmath=True)
+    def best_cos(mat, q):
+        best = -1
+        best_sim = -2.0
+        for i in range(mat.shape[0]):
+            s = 0.0
+            for j in range(mat.shape[1]):
+                s += mat[i, j] * q[j]
+            if s > best_sim:
+                best_sim = s
+                best = i
+        return best, best_sim
+
+    return best_cos
+
+class _SemanticResultCache:
+    """Caches whole query results keyed by query-embedding similarity.
+
+    Cached embeddings sit in one row-normalized float32 matrix, so scoring a
+    new query against every cached one is a single BLAS matrix-vector
+    product. A hit replays the stored result dict without touching Endee,
+    the metadata store, or the LLM. Rows are preallocated in fixed blocks
+    and the least-recently-used entry is overwritten once full.
+    """
+
+    def __init__(self, threshold: float = None, maxsize: int = 4096,
+                 block: int = 1024):
+        self.threshold = threshold or Config.SEMANTIC_CACHE_THRESHOLD
+        self.maxsize = maxsize
+        self.block = block
+        self._matrix: Optional[np.ndarray] = None  # allocated on first put
+        self._entries: List[Tuple[str, int, Dict[str, Any]]] = []
+        self._last_used: Optional[np.ndarray] = None
+        self._n = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+        self._best_cos = _load_best_cos()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, query_embedding, collection_name: str,
+            top_k: int) -> Optional[Dict[str, Any]]:
+        q = np.asarray(query_embedding, dtype=np.float32)
+        with self._lock:
+            if self._n:
+                view = self._matrix[:self._n]
+                if self._best_cos is not None:
+                    best, best_sim = self._best_cos(view, q)
+                    best = int(best)
+                else:
+                    sims = view @ q
+                    best = int(np.argmax(sims))
+                    best_sim = float(sims[best])
+                cached_collection, cached_k, result = self._entries[best]
+                if (best_sim >= self.threshold
+                        and cached_collection == collection_name
+                        and cached_k == top_k):
+                    self._clock += 1
+                    self._last_used[best] = self._clock
+                    self.stats["hits"] += 1
+                    return result
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, query_embedding, collection_name: str, top_k: int,
+            result: Dict[str, Any]) -> None:
+        q = np.asarray(query_embedding, dtype=np.float32)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.empty((self.block, q.shape[0]),
+                                        dtype=np.float32)
+                self._last_used = np.zeros(self.maxsize, dtype=np.int64)
+            self._clock += 1
+            if self._n >= self.maxsize:
+                slot = int(np.argmin(self._last_used[:self._n]))
+            else:
+                if self._n == len(self._matrix):
+                    # Grow by whole blocks instead of reallocating per insert
+                    rows = min(len(self._matrix) + self.block, self.maxsize)
+                    grown = np.empty((rows, q.shape[0]), dtype=np.float32)
+                    grown[:self._n] = self._matrix[:self._n]
+                    self._matrix = grown
+                slot = self._n
+                self._n += 1
+                self._entries.append(("", 0, {}))
+            self._matrix[slot] = q
+            self._entries[slot] = (collection_name, top_k, result)
+            self._last_used[slot] = self._clock
+
 class RAGPipeline:
     """Complete RAG (Retrieval-Augmented Generation) pipeline."""
     
@@ -23,21 +153,70 @@ class RAGPipeline:
         self.vector_store = EndeeVectorStore()
         self.doc_processor = DocumentProcessor()
         self.embedding_service = EmbeddingService()
-        
-        # Try Ollama first, fallback to simple text answerer
-        try:
-            self.answer_generator = AnswerGenerator()
-            self.use_ai = True
-        except Exception as e:
-            logger.warning(f"AI answer generator not available: {e}")
-            self.answer_generator = SimpleTextAnswerer()
-            self.use_ai = False
-        
+
+        # Repeated questions skip the transformer forward pass entirely —
+        # the dominant cost of the query path. lru_cache's C implementation
+        # takes its own lock, so this is safe under FastAPI's thread pool.
+        self._query_emb_cache = functools.lru_cache(maxsize=1024)(
+            self.embedding_service.encode_text)
+
+        # Near-duplicate questions short-circuit to a previously built
+        # result before retrieval even runs
+        self._result_cache = _SemanticResultCache()
+
+        # Chunk metadata lives in per-collection SQLite files; a small LRU
+        # of (collection, chunk_id) -> row keeps repeat lookups off disk
+        self._meta_cache: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._meta_cache_size = 4096
+        self._db_conns: Dict[str, sqlite3.Connection] = {}
+        self._db_lock = threading.Lock()
+
+
+        # The AI generator (Gemini client init, semantic cache collection)
+        # is only built when an answer is actually requested; callers that
+        # never generate (fast mode, pure ingest) skip its cold start.
+        # use_ai starts as a cheap config probe and flips to False on first
+        # access if construction fails.
+        self._answer_generator = None
+        self.use_ai = bool(Config.GEMINI_API_KEY)
+
+        # Private event loop for driving async streaming from sync callers
+        # (created on first use, reused so the pooled async HTTP client
+        # stays bound to one loop). The lock serializes sync streamers:
+        # run_until_complete cannot be entered on a loop that is already
+        # running, and Streamlit drives one cached pipeline from a thread
+        # per session.
+        self._stream_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stream_lock = threading.Lock()
+
+
         # Ensure upload directory exists
         os.makedirs(Config.UPLOAD_DIR, exist_ok=True)
         
         self._initialize()
-    
+
+    @property
+    def answer_generator(self):
+        """Answer backend, constructed lazily on first access.
+
+        Falls back to SimpleTextAnswerer (and clears use_ai) when the AI
+        generator can't be built. Read this property before branching on
+        use_ai so the flag reflects reality.
+        """
+        if self._answer_generator is None:
+            if self.use_ai:
+                try:
+                    self._answer_generator = AnswerGenerator(
+                        embedding_service=self.embedding_service,
+                        vector_store=self.vector_store
+                    )
+                except Exception as e:
+                    logger.warning(f"AI answer generator not available: {e}")
+                    self.use_ai = False
+            if self._answer_generator is None:
+                self._answer_generator = SimpleTextAnswerer()
+        return self._answer_generator
+
     def _initialize(self):
         """Initialize the RAG system."""
         logger.info("Initializing RAG pipeline...")
@@ -65,212 +244,728 @@ class RAGPipeline:
         
         logger.info("RAG pipeline initialized successfully")
     
-    def _store_metadata(self, collection_name: str, chunk_ids: List[str], chunks: List[Dict]) -> None:
-        """Store metadata separately since Endee doesn't support it directly."""
-        metadata_file = self.metadata_dir / f"{collection_name}_metadata.json"
-        
-        # Load existing metadata if it exists
-        existing_metadata = {}
-        if metadata_file.exists():
+    def _collection_db(self, collection_name: str) -> sqlite3.Connection:
+        """SQLite connection for a collection's chunk metadata, opened once.
+
+        Queries become O(1) B-tree point reads served from SQLite's page
+        cache instead of re-reading the collection's entire metadata file.
+        First open creates the table and migrates any legacy JSON/JSONL
+        metadata files.
+        """
+        with self._db_lock:
+            conn = self._db_conns.get(collection_name)
+            if conn is not None:
+                return conn
+
+            db_path = self.metadata_dir / f"{collection_name}.db"
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks("
+                "id TEXT PRIMARY KEY, text TEXT, meta BLOB)")
+            self._migrate_legacy_metadata(collection_name, conn)
+            self._db_conns[collection_name] = conn
+            return conn
+
+    def _migrate_legacy_metadata(self, collection_name: str,
+                                 conn: sqlite3.Connection) -> None:
+        """One-time import of pre-SQLite metadata files into the chunks table."""
+        rows = []
+
+        legacy_json = self.metadata_dir / f"{collection_name}_metadata.json"
+        if legacy_json.exists():
             try:
-                with open(metadata_file, 'r') as f:
-                    existing_metadata = json.load(f)
-            except:
-                existing_metadata = {}
-        
-        # Add new metadata
-        for chunk_id, chunk in zip(chunk_ids, chunks):
-            existing_metadata[chunk_id] = {
-                "text": chunk["text"],
-                "metadata": chunk["metadata"]
-            }
-        
-        # Save updated metadata
-        with open(metadata_file, 'w') as f:
-            json.dump(existing_metadata, f, indent=2)
-    
+                with open(legacy_json, 'rb') as f:
+                    for chunk_id, payload in _json_loads(f.read()).items():
+                        rows.append((chunk_id, payload.get("text", ""),
+                                     _json_dumps(payload.get("metadata", {}))))
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable metadata file {legacy_json}: {e}")
+
+        legacy_jsonl = self.metadata_dir / f"{collection_name}_metadata.jsonl"
+        if legacy_jsonl.exists():
+            with open(legacy_jsonl, 'rb') as f:
+                for line in f:
+                    try:
+                        record = _json_loads(line)
+                    except ValueError:
+                        continue  # torn write from a crashed process
+                    rows.append((record["id"], record.get("text", ""),
+                                 _json_dumps(record.get("metadata", {}))))
+
+        if rows:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunks(id, text, meta) "
+                    "VALUES (?, ?, ?)", rows)
+            logger.info(f"Migrated {len(rows)} metadata records for "
+                        f"'{collection_name}' into SQLite")
+
+        for path in (legacy_json, legacy_jsonl):
+            if path.exists():
+                path.rename(path.with_suffix(path.suffix + ".migrated"))
+
+    def _cache_metadata(self, collection_name: str, chunk_id: str,
+                        payload: Dict) -> None:
+        """Insert into the metadata LRU; caller holds _db_lock."""
+        self._meta_cache[(collection_name, chunk_id)] = payload
+        self._meta_cache.move_to_end((collection_name, chunk_id))
+        while len(self._meta_cache) > self._meta_cache_size:
+            self._meta_cache.popitem(last=False)
+
+    def _store_metadata(self, collection_name: str, chunk_ids: List[str],
+                        chunks: List[Dict],
+                        meta_blobs: List[bytes] = None) -> None:
+        """Store metadata separately since Endee doesn't support it directly.
+
+        One executemany batch inside a single transaction per ingest
+        minibatch — O(new chunks) work regardless of collection size.
+        Callers that already serialized each chunk's metadata can pass the
+        bytes via meta_blobs to avoid encoding them a second time.
+        """
+        conn = self._collection_db(collection_name)
+        if meta_blobs is None:
+            meta_blobs = [_json_dumps(chunk["metadata"]) for chunk in chunks]
+        rows = [
+            (chunk_id, chunk["text"], blob)
+            for chunk_id, chunk, blob in zip(chunk_ids, chunks, meta_blobs)
+        ]
+        with self._db_lock:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunks(id, text, meta) "
+                    "VALUES (?, ?, ?)", rows)
+            for chunk_id, chunk in zip(chunk_ids, chunks):
+                self._cache_metadata(collection_name, chunk_id, {
+                    "text": chunk["text"],
+                    "metadata": chunk["metadata"]
+                })
+
     def _get_metadata(self, collection_name: str, chunk_ids: List[str]) -> Dict[str, Dict]:
         """Retrieve stored metadata for given chunk IDs."""
-        metadata_file = self.metadata_dir / f"{collection_name}_metadata.json"
-        
-        if not metadata_file.exists():
-            return {}
-        
-        try:
-            with open(metadata_file, 'r') as f:
-                all_metadata = json.load(f)
-            
-            # Return only requested chunk metadata
-            return {chunk_id: all_metadata.get(chunk_id, {}) for chunk_id in chunk_ids}
-        except:
-            return {}
+        conn = self._collection_db(collection_name)
+        found: Dict[str, Dict] = {}
+        with self._db_lock:
+            missing = []
+            for chunk_id in chunk_ids:
+                payload = self._meta_cache.get((collection_name, chunk_id))
+                if payload is not None:
+                    self._meta_cache.move_to_end((collection_name, chunk_id))
+                    found[chunk_id] = payload
+                else:
+                    missing.append(chunk_id)
+
+            if missing:
+                placeholders = ",".join("?" * len(missing))
+                cursor = conn.execute(
+                    f"SELECT id, text, meta FROM chunks "
+                    f"WHERE id IN ({placeholders})", missing)
+                for chunk_id, text, meta in cursor:
+                    payload = {"text": text, "metadata": _json_loads(meta)}
+                    found[chunk_id] = payload
+                    self._cache_metadata(collection_name, chunk_id, payload)
+
+        return {chunk_id: found.get(chunk_id, {}) for chunk_id in chunk_ids}
     
-    def ingest_document(self, file_path: str, collection_name: str = None) -> Dict[str, Any]:
+    #: Chunks embedded and inserted per pipeline step; bounds peak memory
+    #: to O(batch) regardless of document size. Sized at 2x the encoder's
+    #: largest device batch (128 on GPU) so every forward pass runs with a
+    #: full batch dimension instead of whatever tail the minibatch leaves
+    INGEST_BATCH = 256
+
+    def _ingest_chunks(self, chunks: List[Dict], filename: str,
+                       collection_name: str,
+                       progress_callback: Callable[[int, int], None] = None) -> Dict[str, Any]:
+        """Embed processed chunks and store them plus their metadata.
+
+        Producer/consumer pipeline over fixed-size minibatches: the calling
+        thread encodes (CPU/GPU-bound) and feeds a bounded queue; an
+        inserter thread drains it, writing metadata and POSTing vectors
+        (network-bound). The queue cap keeps at most a few embedded batches
+        alive at once, so peak memory stays O(batch) while the two stages
+        overlap fully. progress_callback(done, total) fires as each batch
+        lands in Endee.
+        """
+        stem = Path(filename).stem
+        total = len(chunks)
+        batches = [chunks[i:i + self.INGEST_BATCH]
+                   for i in range(0, total, self.INGEST_BATCH)]
+
+        work: "queue.Queue" = queue.Queue(maxsize=4)
+        failures: List[Exception] = []
+        done = 0
+
+        def insert_worker():
+            nonlocal done
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                if failures:
+                    continue  # drain remaining batches after an error
+                chunk_ids, embeddings, batch = item
+                try:
+                    # Serialize each chunk's metadata exactly once: the
+                    # bytes become the SQLite meta BLOB and are spliced
+                    # into the {text, metadata} JSON payload that rides in
+                    # each vector's meta field
+                    meta_blobs = [_json_dumps(chunk["metadata"])
+                                  for chunk in batch]
+                    self._store_metadata(collection_name, chunk_ids, batch,
+                                         meta_blobs=meta_blobs)
+                    payloads = [
+                        zlib.compress(b'{"text":' + _json_dumps(chunk["text"])
+                                      + b',"metadata":' + blob + b'}')
+                        for chunk, blob in zip(batch, meta_blobs)
+                    ]
+                    success = self.vector_store.add_vectors(
+                        collection_name,
+                        embeddings,
+                        [chunk["metadata"] for chunk in batch],  # ignored by Endee
+                        chunk_ids,
+                        payloads=payloads
+                    )
+                    if not success:
+                        raise Exception("Failed to store vectors")
+                    done += len(batch)
+                    if progress_callback is not None:
+                        progress_callback(done, total)
+                except Exception as e:
+                    failures.append(e)
+
+        consumer = threading.Thread(target=insert_worker, daemon=True)
+        consumer.start()
+        try:
+            for batch in batches:
+                if failures:
+                    break
+                embeddings = self.embedding_service.encode_batch(
+                    [chunk["text"] for chunk in batch])
+                # Unit-length rows are what make the index's inner-product
+                # space equal cosine without per-comparison normalization;
+                # enforce it here rather than trusting encoder flags
+                # (idempotent when the encoder already normalized)
+                embeddings = embeddings / (
+                    np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12)
+                # Ids derive from each chunk's own source file so a mixed
+                # multi-document batch stays unambiguous
+                chunk_ids = [
+                    f"{Path(chunk['metadata'].get('filename', stem)).stem}"
+                    f"_{chunk['metadata']['chunk_index']}"
+                    for chunk in batch
+                ]
+                work.put((chunk_ids, embeddings, batch))
+        finally:
+            work.put(None)
+            consumer.join()
+
+        if failures:
+            raise failures[0]
+
+        result = {
+            "status": "success",
+            "filename": Path(filename).name,
+            "chunks_created": len(chunks),
+            "collection": collection_name,
+            "document_metadata": chunks[0]["metadata"] if chunks else {}
+        }
+        logger.info(f"Successfully ingested document: {result}")
+        return result
+
+    def ingest_document(self, file_path: str, collection_name: str = None,
+                        progress_callback: Callable[[int, int], None] = None) -> Dict[str, Any]:
         """Ingest a document into the vector database."""
         collection_name = collection_name or Config.DEFAULT_COLLECTION
-        
+
         try:
             logger.info(f"Ingesting document: {file_path}")
-            
-            # Process document into chunks
             chunks = self.doc_processor.process_document(file_path)
-            
-            # Generate embeddings for chunks
-            chunk_texts = [chunk["text"] for chunk in chunks]
-            embeddings = self.embedding_service.encode_batch(chunk_texts)
-            
-            # Prepare data for vector store
-            metadata = [chunk["metadata"] for chunk in chunks]
-            chunk_ids = [
-                f"{Path(file_path).stem}_{chunk['metadata']['chunk_index']}"
-                for chunk in chunks
-            ]
-            
-            # Store metadata separately (Endee doesn't support metadata in vectors)
-            self._store_metadata(collection_name, chunk_ids, chunks)
-            
-            # Store in vector database
-            success = self.vector_store.add_vectors(
-                collection_name,
-                embeddings,
-                metadata,  # Will be ignored by Endee
-                chunk_ids
-            )
-            
-            if success:
-                result = {
+            return self._ingest_chunks(chunks, file_path, collection_name,
+                                       progress_callback=progress_callback)
+
+        except Exception as e:
+            logger.error(f"Document ingestion failed: {e}")
+            return {
+                "status": "error",
+                "error": str(e),
+                "filename": Path(file_path).name if file_path else "unknown"
+            }
+
+    def ingest_documents(self, file_paths: List[str],
+                         collection_name: str = None,
+                         progress_callback: Callable[[int, int], None] = None) -> List[Dict[str, Any]]:
+        """Ingest several documents through one embed/insert pipeline.
+
+        All files' chunks feed a single _ingest_chunks run, so the
+        embedding minibatches and Endee insert requests span file
+        boundaries: N small files cost ceil(total_chunks / INGEST_BATCH)
+        round trips instead of at least one per file. Returns one result
+        dict per input file, in order of processing.
+        """
+        collection_name = collection_name or Config.DEFAULT_COLLECTION
+        results: List[Dict[str, Any]] = []
+        per_file: List[Tuple[str, List[Dict]]] = []
+
+        for file_path in file_paths:
+            try:
+                chunks = self.doc_processor.process_document(file_path)
+                per_file.append((Path(file_path).name, chunks))
+            except Exception as e:
+                logger.error(f"Document processing failed: {e}")
+                results.append({
+                    "status": "error",
+                    "error": str(e),
+                    "filename": Path(file_path).name
+                })
+
+        results.extend(self._ingest_batch(per_file, collection_name,
+                                          progress_callback))
+        return results
+
+    def ingest_streams(self, files: List[Tuple[Any, str]],
+                       collection_name: str = None,
+                       progress_callback: Callable[[int, int], None] = None) -> List[Dict[str, Any]]:
+        """Batch-ingest documents from open file objects.
+
+        Each item is a (fileobj, filename) pair; parsing happens straight
+        from the stream, so callers holding uploads in memory never touch
+        disk on the happy path. A loader that insists on a real filesystem
+        path gets a temp copy (written under the original name so chunk
+        ids stay stable). Batching semantics match ingest_documents.
+        """
+        collection_name = collection_name or Config.DEFAULT_COLLECTION
+        results: List[Dict[str, Any]] = []
+        per_file: List[Tuple[str, List[Dict]]] = []
+        tmp_dirs: List[str] = []
+
+        for fileobj, filename in files:
+            try:
+                try:
+                    chunks = self.doc_processor.process_file(fileobj, filename)
+                except Exception:
+                    # Fallback for formats that need a path on disk
+                    fileobj.seek(0)
+                    tmp_dir = tempfile.mkdtemp()
+                    tmp_dirs.append(tmp_dir)
+                    tmp_path = os.path.join(tmp_dir, Path(filename).name)
+                    with open(tmp_path, "wb") as tmp_file:
+                        shutil.copyfileobj(fileobj, tmp_file, length=1 << 20)
+                    chunks = self.doc_processor.process_document(tmp_path)
+                per_file.append((Path(filename).name, chunks))
+            except Exception as e:
+                logger.error(f"Document processing failed: {e}")
+                results.append({
+                    "status": "error",
+                    "error": str(e),
+                    "filename": Path(filename).name
+                })
+
+        if tmp_dirs:
+            # The chunks are parsed; reclaiming the temp copies is pure
+            # filesystem bookkeeping, so let it overlap the embed/insert
+            # work instead of stalling between files
+            threading.Thread(
+                target=lambda dirs=tmp_dirs: [
+                    shutil.rmtree(d, ignore_errors=True) for d in dirs],
+                daemon=True).start()
+
+        results.extend(self._ingest_batch(per_file, collection_name,
+                                          progress_callback))
+        return results
+
+    def _ingest_batch(self, per_file: List[Tuple[str, List[Dict]]],
+                      collection_name: str,
+                      progress_callback: Callable[[int, int], None] = None) -> List[Dict[str, Any]]:
+        """Shared tail of the multi-document ingest APIs: one
+        _ingest_chunks pass over every file's chunks, then per-file result
+        dicts."""
+        results: List[Dict[str, Any]] = []
+        if not per_file:
+            return results
+
+        all_chunks = [chunk for _, chunks in per_file for chunk in chunks]
+        try:
+            self._ingest_chunks(all_chunks, "batch", collection_name,
+                                progress_callback=progress_callback)
+            for name, chunks in per_file:
+                results.append({
                     "status": "success",
-                    "filename": Path(file_path).name,
+                    "filename": name,
                     "chunks_created": len(chunks),
                     "collection": collection_name,
                     "document_metadata": chunks[0]["metadata"] if chunks else {}
-                }
-                logger.info(f"Successfully ingested document: {result}")
-                return result
-            else:
-                raise Exception("Failed to store vectors")
-                
+                })
+        except Exception as e:
+            logger.error(f"Batch ingestion failed: {e}")
+            for name, _ in per_file:
+                results.append({
+                    "status": "error",
+                    "error": str(e),
+                    "filename": name
+                })
+        return results
+
+    def ingest_stream(self, fileobj, filename: str,
+                      collection_name: str = None,
+                      progress_callback: Callable[[int, int], None] = None) -> Dict[str, Any]:
+        """Ingest a document from an open file object, without a disk path."""
+        collection_name = collection_name or Config.DEFAULT_COLLECTION
+
+        try:
+            logger.info(f"Ingesting document from stream: {filename}")
+            chunks = self.doc_processor.process_file(fileobj, filename)
+            return self._ingest_chunks(chunks, filename, collection_name,
+                                       progress_callback=progress_callback)
+
         except Exception as e:
             logger.error(f"Document ingestion failed: {e}")
             return {
                 "status": "error",
                 "error": str(e),
-                "filename": Path(file_path).name if file_path else "unknown"
+                "filename": Path(filename).name if filename else "unknown"
             }
     
-    def query(self, question: str, collection_name: str = None, 
+    def _retrieve(self, question: str, collection_name: str, top_k: int):
+        """Embed the question, search Endee, and collect contexts + sources.
+
+        Returns (contexts, sources, chunk_ids, early_result) where
+        early_result is a complete response dict when retrieval found nothing
+        usable; chunk_ids are the Endee point ids of the kept contexts.
+        """
+        query_embedding = self._embed_query(question)
+
+        # Search for relevant documents
+        search_results = self.vector_store.search_vectors(
+            collection_name,
+            query_embedding,
+            top_k
+        )
+
+        return self._assemble_retrieval(question, collection_name, search_results)
+
+    async def _aretrieve(self, question: str, collection_name: str, top_k: int):
+        """Async retrieval: embedding runs in a worker thread (CPU-bound,
+        keeps the event loop free) and the Endee search goes through the
+        shared async HTTP client."""
+        query_embedding = await asyncio.to_thread(self._embed_query, question)
+        search_results = await self.vector_store.asearch_vectors(
+            collection_name,
+            query_embedding,
+            top_k
+        )
+        return self._assemble_retrieval(question, collection_name, search_results)
+
+    def _run_async(self, coro):
+        """Run a coroutine on the pipeline's persistent private loop.
+
+        Sync entry points must share one loop rather than calling
+        asyncio.run per invocation: the Gemini client's async gRPC channel
+        binds to the first loop it runs on, so a fresh-loop-per-call
+        pattern leaves the second call driving a channel attached to a
+        closed loop. _stream_lock serializes sync callers the same way it
+        does for query_stream.
+        """
+        with self._stream_lock:
+            if self._stream_loop is None:
+                self._stream_loop = asyncio.new_event_loop()
+            return self._stream_loop.run_until_complete(coro)
+
+    def _embed_query(self, question: str):
+        """Embed a question (cached) and renormalize to the unit-vector
+        ingest convention."""
+        query_embedding = self._query_emb_cache(question)
+        return query_embedding / (np.linalg.norm(query_embedding) + 1e-12)
+
+    def _assemble_retrieval(self, question: str, collection_name: str,
+                            search_results: List):
+        """Shared post-search half of retrieval: score, filter, and attach
+        chunk payloads/metadata."""
+        if not search_results:
+            return [], [], [], {
+                "status": "no_results",
+                "question": question,
+                "answer": "I couldn't find any relevant documents to answer your question.",
+                "sources": []
+            }
+
+        # Handle Endee's response format: [distance, id, vector, filter, ?, ?]
+        valid = [r for r in search_results
+                 if isinstance(r, (list, tuple)) and len(r) >= 2 and r[1]]
+
+        # Vectorize distance->similarity conversion and threshold filtering:
+        # one branchless mask instead of per-result Python comparisons, with
+        # Endee's ranking order preserved by the boolean slice
+        distances = np.fromiter((r[0] for r in valid), dtype=np.float32,
+                                count=len(valid))
+        all_scores = 1.0 - distances
+        keep = all_scores >= Config.SIMILARITY_THRESHOLD
+        chunk_ids = [r[1] for r, k in zip(valid, keep) if k]
+        scores = dict(zip(chunk_ids, all_scores[keep].tolist()))
+
+        if not chunk_ids:
+            return [], [], [], {
+                "status": "no_results",
+                "question": question,
+                "answer": "I couldn't find any relevant documents to answer your question.",
+                "sources": []
+            }
+
+        # Results ingested via the msgpack path carry their own compressed
+        # payload in the meta field (index 2); only chunks without one —
+        # e.g. vectors inserted before payloads existed — need the SQLite
+        # lookup
+        payload_blobs = {r[1]: r[2] for r, k in zip(valid, keep)
+                         if k and len(r) > 2 and r[2]}
+        metadata_map = {}
+        missing = []
+        for chunk_id in chunk_ids:
+            blob = payload_blobs.get(chunk_id)
+            if blob:
+                try:
+                    metadata_map[chunk_id] = _json_loads(zlib.decompress(blob))
+                    continue
+                except Exception as e:
+                    logger.debug(f"Undecodable search payload for {chunk_id}: {e}")
+            missing.append(chunk_id)
+        if missing:
+            metadata_map.update(self._get_metadata(collection_name, missing))
+
+        # Extract context from metadata
+        contexts = []
+        sources = []
+        kept_chunk_ids = []
+
+        for chunk_id in chunk_ids:
+            chunk_data = metadata_map.get(chunk_id, {})
+            score = scores.get(chunk_id, 0)
+
+            context_text = chunk_data.get("text", "")
+            chunk_metadata = chunk_data.get("metadata", {})
+
+            if context_text:
+                contexts.append(context_text)
+                kept_chunk_ids.append(chunk_id)
+                sources.append({
+                    "filename": chunk_metadata.get("filename", "unknown"),
+                    "chunk_index": chunk_metadata.get("chunk_index", 0),
+                    "score": score
+                })
+
+        if not contexts:
+            return [], [], [], {
+                "status": "low_relevance",
+                "question": question,
+                "answer": "I found some documents, but they don't seem relevant enough to answer your question.",
+                "sources": []
+            }
+
+        return contexts, sources, kept_chunk_ids, None
+
+    def _build_result(self, question: str, answer: str, sources: List[Dict]) -> Dict[str, Any]:
+        """Assemble the final response dict for a successful query."""
+        result = {
+            "status": "success",
+            "question": question,
+            "answer": answer,
+            "sources": sources,
+            "num_sources": len(sources)
+        }
+        if self.use_ai:
+            # Which model the router picked, for observability
+            result["model"] = self.answer_generator.last_model_used
+        logger.info(f"Query completed successfully: {len(sources)} sources used")
+        return result
+
+    def _error_result(self, question: str, error: Exception) -> Dict[str, Any]:
+        logger.error(f"Query failed: {error}")
+        return {
+            "status": "error",
+            "question": question,
+            "error": str(error),
+            "answer": "Sorry, I encountered an error while processing your question.",
+            "sources": []
+        }
+
+    def query(self, question: str, collection_name: str = None,
               top_k: int = None) -> Dict[str, Any]:
-        """Query the RAG system with a question."""
+        """Query the RAG system with a question (synchronous entry point)."""
+        return self.query_with_embedding(
+            question, self._query_emb_cache(question), collection_name, top_k)
+
+    def query_with_embedding(self, question: str, query_embedding,
+                             collection_name: str = None,
+                             top_k: int = None) -> Dict[str, Any]:
+        """Query with a precomputed question embedding.
+
+        Callers that already hold the embedding — e.g. a UI that caches
+        embeddings across reruns, or one that probed its own semantic cache
+        first — skip the encoder entirely; only retrieval and generation
+        run. `query` delegates here after its cached encode.
+        """
         collection_name = collection_name or Config.DEFAULT_COLLECTION
         top_k = top_k or Config.TOP_K_DOCUMENTS
-        
+
         try:
             logger.info(f"Processing query: {question}")
-            
-            # Generate embedding for the question
-            query_embedding = self.embedding_service.encode_text(question)
-            
-            # Search for relevant documents
+
+            query_embedding = np.asarray(query_embedding, dtype=np.float32)
+            query_embedding = query_embedding / (
+                np.linalg.norm(query_embedding) + 1e-12)
+            cached = self._result_cache.get(query_embedding, collection_name, top_k)
+            if cached is not None:
+                return cached
+
             search_results = self.vector_store.search_vectors(
-                collection_name,
-                query_embedding,
-                top_k
-            )
-            
-            if not search_results:
-                return {
-                    "status": "no_results",
-                    "question": question,
-                    "answer": "I couldn't find any relevant documents to answer your question.",
-                    "sources": []
-                }
-            
-            # Extract chunk IDs from search results
-            chunk_ids = []
-            scores = {}
-            
-            # Handle Endee's response format: [distance, id, vector, filter, ?, ?]
-            for result in search_results:
-                if isinstance(result, list) and len(result) >= 2:
-                    distance = result[0]  # Cosine distance
-                    chunk_id = result[1]  # Vector ID
-                    
-                    if chunk_id:
-                        chunk_ids.append(chunk_id)
-                        # Convert cosine distance to similarity score
-                        similarity_score = 1.0 - distance
-                        scores[chunk_id] = similarity_score
-            
-            if not chunk_ids:
-                return {
-                    "status": "no_results",
-                    "question": question,
-                    "answer": "I couldn't find any relevant documents to answer your question.",
-                    "sources": []
-                }
-            
-            # Get metadata for found chunks
-            metadata_map = self._get_metadata(collection_name, chunk_ids)
-            
-            # Extract context from metadata
-            contexts = []
-            sources = []
-            
-            for chunk_id in chunk_ids:
-                chunk_data = metadata_map.get(chunk_id, {})
-                score = scores.get(chunk_id, 0)
-                
-                # Skip results below similarity threshold
-                if score < Config.SIMILARITY_THRESHOLD:
-                    continue
-                
-                context_text = chunk_data.get("text", "")
-                chunk_metadata = chunk_data.get("metadata", {})
-                
-                if context_text:
-                    contexts.append(context_text)
-                    sources.append({
-                        "filename": chunk_metadata.get("filename", "unknown"),
-                        "chunk_index": chunk_metadata.get("chunk_index", 0),
-                        "score": score
-                    })
-            
-            if not contexts:
-                return {
-                    "status": "low_relevance",
-                    "question": question,
-                    "answer": "I found some documents, but they don't seem relevant enough to answer your question.",
-                    "sources": []
-                }
-            
-            # Generate answer using retrieved context
+                collection_name, query_embedding, top_k)
+            contexts, sources, chunk_ids, early_result = self._assemble_retrieval(
+                question, collection_name, search_results)
+            if early_result is not None:
+                return early_result
+
+            # Generate answer using retrieved context (read the property
+            # first: it may flip use_ai on a failed first construction)
+            generator = self.answer_generator
             if self.use_ai:
-                answer = self.answer_generator.generate_answer(question, contexts)
+                answer = self._run_async(generator.generate_answer(
+                    question, contexts, chunk_ids=chunk_ids))
             else:
-                answer = self.answer_generator.generate_answer(question, contexts)
+                answer = generator.generate_answer(question, contexts)
                 answer += "\n\n📝 Note: Using simple text extraction. Install Ollama for AI-powered answers."
-            
-            result = {
-                "status": "success",
-                "question": question,
-                "answer": answer,
-                "sources": sources,
-                "num_sources": len(sources)
-            }
-            
-            logger.info(f"Query completed successfully: {len(sources)} sources used")
+
+            result = self._build_result(question, answer, sources)
+            self._result_cache.put(query_embedding, collection_name, top_k, result)
             return result
-            
+
         except Exception as e:
-            logger.error(f"Query failed: {e}")
-            return {
-                "status": "error",
-                "question": question,
-                "error": str(e),
-                "answer": "Sorry, I encountered an error while processing your question.",
-                "sources": []
-            }
+            return self._error_result(question, e)
+
+    async def aquery(self, question: str, collection_name: str = None,
+                     top_k: int = None) -> Dict[str, Any]:
+        """Async query entry point; awaits answer generation so concurrent
+        requests overlap during the LLM round trip."""
+        collection_name = collection_name or Config.DEFAULT_COLLECTION
+        top_k = top_k or Config.TOP_K_DOCUMENTS
+
+        try:
+            logger.info(f"Processing query: {question}")
+
+            query_embedding = await asyncio.to_thread(self._query_emb_cache, question)
+            cached = self._result_cache.get(query_embedding, collection_name, top_k)
+            if cached is not None:
+                return cached
+
+            contexts, sources, chunk_ids, early_result = await self._aretrieve(question, collection_name, top_k)
+            if early_result is not None:
+                return early_result
+
+            generator = self.answer_generator
+            if self.use_ai:
+                answer = await generator.generate_answer(
+                    question, contexts, chunk_ids=chunk_ids)
+            else:
+                answer = generator.generate_answer(question, contexts)
+                answer += "\n\n📝 Note: Using simple text extraction. Install Ollama for AI-powered answers."
+
+            result = self._build_result(question, answer, sources)
+            self._result_cache.put(query_embedding, collection_name, top_k, result)
+            return result
+
+        except Exception as e:
+            return self._error_result(question, e)
     
+    async def aquery_stream(self, question: str, collection_name: str = None,
+                            top_k: int = None):
+        """Stream a query response as a sequence of event dicts.
+
+        Yields {"type": "answer_chunk", "text": ...} events as generation
+        progresses, then a final {"type": "sources", ...} event (sources are
+        known once retrieval completes, before generation finishes).
+        """
+        collection_name = collection_name or Config.DEFAULT_COLLECTION
+        top_k = top_k or Config.TOP_K_DOCUMENTS
+
+        try:
+            logger.info(f"Processing streaming query: {question}")
+
+            contexts, sources, chunk_ids, early_result = await self._aretrieve(question, collection_name, top_k)
+            if early_result is not None:
+                yield {"type": "answer_chunk", "text": early_result["answer"]}
+                yield {"type": "sources", "status": early_result["status"],
+                       "sources": [], "num_sources": 0}
+                return
+
+            generator = self.answer_generator
+            if self.use_ai:
+                async for text in generator.generate_answer_stream(question, contexts):
+                    yield {"type": "answer_chunk", "text": text}
+            else:
+                answer = generator.generate_answer(question, contexts)
+                answer += "\n\n📝 Note: Using simple text extraction. Install Ollama for AI-powered answers."
+                yield {"type": "answer_chunk", "text": answer}
+
+            yield {"type": "sources", "status": "success",
+                   "sources": sources, "num_sources": len(sources)}
+
+        except Exception as e:
+            error_result = self._error_result(question, e)
+            yield {"type": "answer_chunk", "text": error_result["answer"]}
+            yield {"type": "sources", "status": "error", "sources": [], "num_sources": 0}
+
+    def query_stream(self, question: str, collection_name: str = None,
+                     top_k: int = None):
+        """Synchronous token stream for callers without an event loop.
+
+        Yields answer text chunks as generation progresses, then one final
+        {"type": "sources", ...} dict: callers render the str chunks and
+        keep the trailing event, so nothing is handed back through shared
+        instance state that concurrent sessions could clobber. The async
+        generator is driven on a private loop serialized by _stream_lock —
+        a second session streams after the first instead of crashing on an
+        already-running loop. A semantic-cache hit streams the stored
+        answer immediately, and completed streams are cached like
+        non-streaming queries.
+        """
+        collection_name = collection_name or Config.DEFAULT_COLLECTION
+        top_k = top_k or Config.TOP_K_DOCUMENTS
+
+        query_embedding = self._embed_query(question)
+        cached = self._result_cache.get(query_embedding, collection_name, top_k)
+        if cached is not None:
+            yield cached["answer"]
+            yield {"type": "sources", "status": cached["status"],
+                   "sources": cached["sources"],
+                   "num_sources": cached.get("num_sources", 0)}
+            return
+
+        answer_parts: List[str] = []
+        final_event: Optional[Dict[str, Any]] = None
+        with self._stream_lock:
+            if self._stream_loop is None:
+                self._stream_loop = asyncio.new_event_loop()
+            loop = self._stream_loop
+
+            agen = self.aquery_stream(question, collection_name, top_k)
+            try:
+                while True:
+                    try:
+                        event = loop.run_until_complete(agen.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    if event["type"] == "answer_chunk":
+                        answer_parts.append(event["text"])
+                        yield event["text"]
+                    elif event["type"] == "sources":
+                        final_event = event
+            finally:
+                loop.run_until_complete(agen.aclose())
+
+        if final_event is not None:
+            if final_event.get("status") == "success":
+                result = self._build_result(question, "".join(answer_parts),
+                                            final_event["sources"])
+                self._result_cache.put(query_embedding, collection_name,
+                                       top_k, result)
+            yield final_event
+
     def list_documents(self, collection_name: str = None) -> List[Dict]:
         """List all documents in a collection."""
         collection_name = collection_name or Config.DEFAULT_COLLECTION
@@ -290,12 +985,35 @@ class RAGPipeline:
         """Delete a collection and all its documents."""
         return self.vector_store.delete_collection(collection_name)
     
+    def refresh_status(self) -> Dict[str, Any]:
+        """Re-probe Endee and return fresh status, without reinitializing.
+
+        The heavy pipeline state (embedding model, caches, DB connections)
+        is connection-independent; a reconnect only needs the health probe
+        re-run, so this costs one HTTP round trip instead of a full
+        rebuild.
+        """
+        self.vector_store.reset_health_cache()
+        return self.get_system_status()
+
     def get_system_status(self) -> Dict[str, Any]:
         """Get system status and health information."""
-        return {
+        status = {
             "endee_status": "connected" if self.vector_store.health_check() else "disconnected",
             "collections": self.vector_store.list_collections(),
             "embedding_model": self.embedding_service.model_name,
             "embedding_dimension": self.embedding_service.get_dimension(),
             "default_collection": Config.DEFAULT_COLLECTION
-        }
\ No newline at end of file
+        }
+        emb_info = self._query_emb_cache.cache_info()
+        status["query_embedding_cache"] = {
+            "hits": emb_info.hits,
+            "misses": emb_info.misses
+        }
+        status["semantic_result_cache"] = dict(self._result_cache.stats)
+        # Don't force the lazy generator into existence just for a status
+        # poll; report its caches only once it has been built
+        if self.use_ai and self._answer_generator is not None:
+            status["answer_cache"] = dict(self._answer_generator.response_cache.stats)
+            status["prompt_cache"] = dict(self._answer_generator.structural_cache.stats)
+        return status
\ No newline at end of file
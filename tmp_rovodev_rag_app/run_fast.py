@@ -3,6 +3,10 @@
 import argparse
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
 from rag_pipeline import RAGPipeline
 from simple_text_answer import SimpleTextAnswerer
 
@@ -27,61 +31,85 @@ def main():
     query_embedding = rag.embedding_service.encode_text(args.question)
     search_results = rag.vector_store.search_vectors(args.collection, query_embedding, 5)
     
-    # Extract contexts
-    chunk_ids = []
-    scores = {}
-    for result in search_results:
-        if isinstance(result, list) and len(result) >= 2:
-            distance = result[0]
-            chunk_id = result[1]
-            chunk_ids.append(chunk_id)
-            scores[chunk_id] = 1.0 - distance
-    
+    # Extract contexts: convert distances and apply the similarity
+    # threshold in one vectorized pass, keeping Endee's ranking order
+    valid = [r for r in search_results
+             if isinstance(r, (list, tuple)) and len(r) >= 2 and r[1]]
+    distances = np.fromiter((r[0] for r in valid), dtype=np.float32,
+                            count=len(valid))
+    all_scores = 1.0 - distances
+    keep = all_scores >= 0.3  # Similarity threshold
+    chunk_ids = [r[1] for r, k in zip(valid, keep) if k]
+    scores = dict(zip(chunk_ids, all_scores[keep].tolist()))
+
     metadata_map = rag._get_metadata(args.collection, chunk_ids)
     contexts = []
     sources = []
-    
+
     for chunk_id in chunk_ids:
         chunk_data = metadata_map.get(chunk_id, {})
         score = scores.get(chunk_id, 0)
-        
-        if score >= 0.3:  # Similarity threshold
-            context_text = chunk_data.get("text", "")
-            chunk_metadata = chunk_data.get("metadata", {})
-            
-            if context_text:
-                contexts.append(context_text)
-                sources.append({
-                    "filename": chunk_metadata.get("filename", "unknown"),
-                    "chunk_index": chunk_metadata.get("chunk_index", 0),
-                    "score": score
-                })
+        context_text = chunk_data.get("text", "")
+        chunk_metadata = chunk_data.get("metadata", {})
+
+        if context_text:
+            contexts.append(context_text)
+            sources.append({
+                "filename": chunk_metadata.get("filename", "unknown"),
+                "chunk_index": chunk_metadata.get("chunk_index", 0),
+                "score": score
+            })
     
     if not contexts:
         print("❌ No relevant documents found.")
         return
     
-    # Fast mode
-    if args.mode in ["fast", "both"]:
+    def run_fast_mode():
+        start = time.perf_counter()
+        answer = simple_answerer.generate_answer(args.question, contexts)
+        return answer, time.perf_counter() - start
+
+    def run_ai_mode():
+        start = time.perf_counter()
+        # Reading the property may flip use_ai if construction fails
+        generator = rag.answer_generator
+        if rag.use_ai:
+            # The pipeline's persistent loop, not asyncio.run: the Gemini
+            # channel stays bound to one loop across calls
+            answer = rag._run_async(generator.generate_answer(
+                args.question, contexts))
+        else:
+            answer = generator.generate_answer(args.question, contexts)
+        return answer, time.perf_counter() - start
+
+    fast_result = ai_result = None
+    if args.mode == "both":
+        # The two answers share only the precomputed contexts, so run them
+        # in parallel: wall time becomes max(fast, ai) instead of the sum,
+        # and fast (~ms) rides along with the multi-second AI call for free
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            fast_future = pool.submit(run_fast_mode)
+            ai_future = pool.submit(run_ai_mode)
+            fast_result = fast_future.result()
+            ai_result = ai_future.result()
+    elif args.mode == "fast":
+        fast_result = run_fast_mode()
+    else:
+        ai_result = run_ai_mode()
+
+    if fast_result is not None:
+        fast_answer, fast_time = fast_result
         print("⚡ FAST MODE (Instant Text Extraction)")
-        start = time.time()
-        fast_answer = simple_answerer.generate_answer(args.question, contexts)
-        fast_time = time.time() - start
-        
         print(f"⏱️ Time: {fast_time:.2f}s")
         print(f"💡 Answer: {fast_answer}")
         print(f"📚 Sources: {len(sources)} documents")
-        
+
         if args.mode == "both":
             print("\n" + "=" * 60)
-    
-    # AI mode
-    if args.mode in ["ai", "both"]:
+
+    if ai_result is not None:
+        ai_answer, ai_time = ai_result
         print("🤖 AI MODE (Ollama Generation)")
-        start = time.time()
-        ai_answer = rag.answer_generator.generate_answer(args.question, contexts)
-        ai_time = time.time() - start
-        
         print(f"⏱️ Time: {ai_time:.1f}s")
         print(f"💡 Answer: {ai_answer}")
         print(f"📚 Sources: {len(sources)} documents")
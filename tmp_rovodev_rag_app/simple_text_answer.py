@@ -1,64 +1,70 @@
 """Simple text-based answer generation without AI models."""
 
 from typing import List
+import heapq
 import re
 
+# Compiled once at import: these run on every query, and re-parsing the
+# pattern plus rebuilding the stop-word set per call is pure overhead
+_SENT_RE = re.compile(r'[.!?]+')
+_WORD_RE = re.compile(r'\b\w+\b')
+_STOP = frozenset({
+    'what', 'is', 'are', 'how', 'why', 'where', 'when', 'who', 'the', 'a',
+    'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with',
+    'by'
+})
+
 class SimpleTextAnswerer:
     """Generate simple answers by extracting relevant text from context."""
-    
+
     def generate_answer(self, question: str, contexts: List[str]) -> str:
         """Generate a simple answer by extracting relevant sentences."""
         try:
-            # Combine all contexts
-            combined_text = " ".join(contexts)
-            
-            # Extract key terms from question
-            question_words = self._extract_keywords(question.lower())
-            
-            # Split context into sentences
-            sentences = re.split(r'[.!?]+', combined_text)
-            sentences = [s.strip() for s in sentences if len(s.strip()) > 10]
-            
-            # Score sentences based on keyword matches
-            scored_sentences = []
-            for sentence in sentences:
-                score = self._score_sentence(sentence.lower(), question_words)
-                if score > 0:
-                    scored_sentences.append((score, sentence.strip()))
-            
-            # Sort by score and take top sentences
-            scored_sentences.sort(reverse=True, key=lambda x: x[0])
-            top_sentences = [sent[1] for sent in scored_sentences[:3]]
-            
-            if top_sentences:
-                answer = "Based on the documents, " + " ".join(top_sentences)
-                if len(answer) > 500:
-                    answer = answer[:500] + "..."
-                return answer
-            else:
+            # Extract key terms from question (deduplicated)
+            question_words = frozenset(self._extract_keywords(question.lower()))
+
+            def scored_sentences():
+                # Stream sentences straight out of each context — no
+                # " ".join copy of the full retrieved text. Each sentence
+                # is tokenized once and scored by set intersection.
+                for context in contexts:
+                    for raw in _SENT_RE.split(context):
+                        sentence = raw.strip()
+                        if len(sentence) <= 10:
+                            continue
+                        tokens = frozenset(_WORD_RE.findall(sentence.lower()))
+                        score = len(question_words & tokens)
+                        if score > 0:
+                            yield score, sentence
+
+            # Only the top 3 are needed — a bounded heap over the stream
+            top_sentences = [
+                sent for _, sent in heapq.nlargest(
+                    3, scored_sentences(), key=lambda x: x[0])
+            ]
+
+            if not top_sentences:
                 return "I found relevant documents but couldn't extract a specific answer to your question. Please review the source documents for more details."
-                
+
+            # Assemble with the 500-char cap applied during the join, so
+            # text past the cut is never concatenated
+            prefix = "Based on the documents, "
+            parts = []
+            length = len(prefix)
+            for i, sentence in enumerate(top_sentences):
+                piece = (" " if i else "") + sentence
+                if length + len(piece) > 500:
+                    parts.append(piece[:500 - length])
+                    parts.append("...")
+                    break
+                parts.append(piece)
+                length += len(piece)
+            return prefix + "".join(parts)
+
         except Exception as e:
             return f"Error generating answer: {str(e)}"
-    
+
     def _extract_keywords(self, question: str) -> List[str]:
         """Extract important keywords from the question."""
-        # Remove common question words
-        stop_words = {'what', 'is', 'are', 'how', 'why', 'where', 'when', 'who', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'}
-        
-        # Simple word extraction
-        words = re.findall(r'\b\w+\b', question.lower())
-        keywords = [word for word in words if word not in stop_words and len(word) > 2]
-        
-        return keywords
-    
-    def _score_sentence(self, sentence: str, keywords: List[str]) -> int:
-        """Score a sentence based on keyword matches."""
-        score = 0
-        for keyword in keywords:
-            if keyword in sentence:
-                score += 1
-                # Bonus for exact word match
-                if f" {keyword} " in f" {sentence} ":
-                    score += 1
-        return score
\ No newline at end of file
+        words = _WORD_RE.findall(question.lower())
+        return [word for word in words if word not in _STOP and len(word) > 2]
@@ -1,41 +1,111 @@
 """Vector store client for Endee vector database."""
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
+import asyncio
 import json
 import logging
+import threading
+import time
 import msgpack
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# One async client per process, shared by every store instance: its
+# connection pool plays the same role the requests.Session does for the
+# sync path
+_async_client = None
+_async_client_lock = threading.Lock()
+
+def _get_async_client() -> "httpx.AsyncClient":
+    global _async_client
+    if _async_client is None:
+        with _async_client_lock:
+            if _async_client is None:
+                _async_client = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=32))
+    return _async_client
+
 class EndeeVectorStore:
     """Client for interacting with Endee vector database."""
-    
-    def __init__(self, base_url: str = None, auth_token: str = None):
+
+    #: Seconds a health probe result stays valid; status pollers and the
+    #: query path share one round trip per window instead of one each
+    HEALTH_TTL = 5.0
+
+    def __init__(self, base_url: str = None, auth_token: str = None,
+                 session: requests.Session = None):
+        """`session` lets multiple stores (or an embedding client talking
+        to the same host) share one connection pool; by default each store
+        builds its own pooled session below."""
+        self._health_cache = (0.0, False)  # (monotonic timestamp, healthy)
         self.base_url = base_url or Config.ENDEE_BASE_URL
         self.auth_token = auth_token or Config.ENDEE_AUTH_TOKEN
         self.headers = {
             "Content-Type": "application/json",
-            "Accept": "application/json"
+            "Accept": "application/json",
+            # Explicitly request compressed responses; requests/urllib3
+            # transparently decompresses, and search results shrink ~3x
+            "Accept-Encoding": "gzip"
         }
         if self.auth_token:
             self.headers["Authorization"] = f"Bearer {self.auth_token}"
-    
-    def _make_request(self, method: str, endpoint: str, data: Dict = None) -> Dict:
-        """Make HTTP request to Endee API."""
+
+        # One persistent session with a connection pool: every call reuses a
+        # warm TCP (and TLS, if any) connection instead of paying the
+        # handshake per request. Retries cover transient connect failures
+        # and 5xx responses with backoff. An injected session keeps its
+        # caller's adapters.
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=16,
+                pool_maxsize=64,
+                max_retries=Retry(total=3, backoff_factor=0.2,
+                                  status_forcelist=(502, 503, 504),
+                                  allowed_methods=None)
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self.session.headers.update(self.headers)
+
+    def _make_request(self, method: str, endpoint: str, data: Dict = None,
+                      body: bytes = None, content_type: str = None) -> Dict:
+        """Make HTTP request to Endee API.
+
+        Pass either `data` (JSON-encoded) or a pre-serialized `body` with
+        its `content_type` (e.g. application/msgpack).
+        """
         url = f"{self.base_url}/api/v1/{endpoint}"
         try:
             if method.upper() == "GET":
-                response = requests.get(url, headers=self.headers, params=data)
+                response = self.session.get(url, params=data)
+            elif method.upper() == "POST" and body is not None:
+                response = self.session.post(
+                    url, data=body, headers={"Content-Type": content_type})
             elif method.upper() == "POST":
-                response = requests.post(url, headers=self.headers, json=data)
+                response = self.session.post(url, json=data)
             elif method.upper() == "PUT":
-                response = requests.put(url, headers=self.headers, json=data)
+                response = self.session.put(url, json=data)
             elif method.upper() == "DELETE":
-                response = requests.delete(url, headers=self.headers)
-            
+                response = self.session.delete(url)
+
             response.raise_for_status()
             
             # Handle different response types
@@ -44,14 +114,20 @@ class EndeeVectorStore:
             
             content_type = response.headers.get('content-type', '')
             if 'application/msgpack' in content_type:
-                # Unpack MessagePack response
+                # Unpack MessagePack response. use_list=False decodes
+                # sequences as tuples — cheaper to allocate and immutable,
+                # since results are only ever indexed, never mutated
                 try:
-                    return msgpack.unpackb(response.content, raw=False)
+                    return msgpack.unpackb(response.content, raw=False,
+                                           use_list=False)
                 except:
                     return {}
             else:
-                # JSON response
+                # JSON response (orjson parses straight from the body bytes
+                # when available)
                 try:
+                    if orjson is not None:
+                        return orjson.loads(response.content)
                     return response.json()
                 except:
                     return {"text": response.text}
@@ -60,17 +136,34 @@ class EndeeVectorStore:
             logger.error(f"Request failed: {e}")
             raise Exception(f"Failed to connect to Endee: {e}")
     
+    def reset_health_cache(self) -> None:
+        """Drop the cached health probe so the next check hits the server."""
+        self._health_cache = (0.0, False)
+
     def health_check(self) -> bool:
-        """Check if Endee is running and accessible."""
+        """Check if Endee is running and accessible (result cached ~5s)."""
+        timestamp, healthy = self._health_cache
+        now = time.monotonic()
+        if now - timestamp < self.HEALTH_TTL:
+            return healthy
+
         try:
             result = self._make_request("GET", "health")
-            return result.get("status") == "ok"
+            healthy = result.get("status") == "ok"
         except:
-            return False
+            healthy = False
+        self._health_cache = (now, healthy)
+        return healthy
     
-    def create_collection(self, collection_name: str, dimension: int, 
-                         metric: str = "cosine") -> bool:
-        """Create a new collection/index in Endee."""
+    def create_collection(self, collection_name: str, dimension: int,
+                          metric: str = "ip") -> bool:
+        """Create a new collection/index in Endee.
+
+        Defaults to inner product: EmbeddingService emits unit-length
+        vectors, so IP equals cosine while skipping the per-comparison
+        normalization inside the index. Writers that store unnormalized
+        vectors must pass metric="cosine" explicitly.
+        """
         data = {
             "index_name": collection_name,
             "dim": dimension,
@@ -96,38 +189,64 @@ class EndeeVectorStore:
         except:
             return []
     
-    def add_vectors(self, collection_name: str, vectors: List[List[float]], 
-                   metadata: List[Dict] = None, ids: List[str] = None) -> bool:
-        """Add vectors to a collection."""
+    def add_vectors(self, collection_name: str, vectors,
+                    metadata: List[Dict] = None, ids: List[str] = None,
+                    payloads: List[bytes] = None) -> bool:
+        """Add vectors (ndarray or list-of-lists) to a collection.
+
+        The batch is sent as msgpack rather than JSON: with
+        use_single_float each component is 5 bytes on the wire instead of
+        ~15 characters of ASCII, and neither side pays the float<->string
+        conversion. Endee's msgpack vector object is the positional array
+        [id, meta, filter, norm, vector]; meta/filter/norm are sent with
+        the same defaults its JSON path assumes.
+
+        `payloads` are opaque per-vector bytes stored in the meta field and
+        returned verbatim with every search hit — callers can use them to
+        avoid a separate metadata lookup at query time.
+
+        `vectors` should be a C-contiguous float32 ndarray (lists are
+        accepted and converted). Endee's schema types the vector as a
+        msgpack float array, so the rows can't be shipped as one raw
+        tobytes() buffer; the per-float Python objects msgpack needs are
+        materialized by a single C-level tolist() at the serialization
+        boundary rather than element by element in Python.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        # Single C-level conversion at the serialization boundary
+        vectors = vectors.tolist()
         if metadata is None:
             metadata = [{}] * len(vectors)
         if ids is None:
             ids = [str(i) for i in range(len(vectors))]
-            
-        # Endee expects array of vector objects
-        vector_objects = [
-            {
-                "id": doc_id,
-                "vector": vector
-                # Note: Endee doesn't support metadata in vectors directly
-                # Metadata would need to be stored separately
-            }
-            for doc_id, vector in zip(ids, vectors)
+        if payloads is None:
+            payloads = [b""] * len(vectors)
+
+        batch = [
+            [doc_id, payload, "", 0.0, vector]
+            for doc_id, payload, vector in zip(ids, payloads, vectors)
         ]
-        
+        payload = msgpack.packb(batch, use_single_float=True)
+
         try:
-            self._make_request("POST", f"index/{collection_name}/vector/insert", vector_objects)
+            self._make_request("POST", f"index/{collection_name}/vector/insert",
+                               body=payload, content_type="application/msgpack")
             logger.info(f"Added {len(vectors)} vectors to index '{collection_name}'")
             return True
         except Exception as e:
             logger.error(f"Failed to add vectors: {e}")
             return False
     
-    def search_vectors(self, collection_name: str, query_vector: List[float], 
-                      top_k: int = 5, filters: Dict = None) -> List[Dict]:
-        """Search for similar vectors in a collection."""
+    def search_vectors(self, collection_name: str, query_vector,
+                       top_k: int = 5, filters: Dict = None) -> List[Dict]:
+        """Search for similar vectors in a collection.
+
+        The search request stays JSON — Endee only parses JSON bodies on
+        this endpoint — but a single query vector is small; the response
+        comes back as msgpack either way.
+        """
         data = {
-            "vector": query_vector,
+            "vector": np.ascontiguousarray(query_vector, dtype=np.float32).tolist(),
             "k": top_k,
             "include_vectors": False
         }
@@ -138,17 +257,60 @@ class EndeeVectorStore:
         try:
             # Endee returns MessagePack, but we'll handle that in the client
             result = self._make_request("POST", f"index/{collection_name}/search", data)
-            
-            # Handle the response - Endee may return different format
-            if isinstance(result, list):
-                return result
-            elif isinstance(result, dict) and "results" in result:
-                return result["results"]
-            else:
+            return self._extract_results(result)
+        except Exception as e:
+            logger.error(f"Search failed: {e}")
+            return []
+
+    async def asearch_vectors(self, collection_name: str, query_vector,
+                              top_k: int = 5, filters: Dict = None) -> List[Dict]:
+        """Async variant of search_vectors for event-loop callers.
+
+        Uses the shared httpx.AsyncClient so concurrent queries multiplex
+        over pooled connections without tying up worker threads; when httpx
+        isn't installed, the sync client runs in a thread instead.
+        """
+        if httpx is None:
+            return await asyncio.to_thread(
+                self.search_vectors, collection_name, query_vector,
+                top_k, filters)
+
+        data = {
+            "vector": np.ascontiguousarray(query_vector, dtype=np.float32).tolist(),
+            "k": top_k,
+            "include_vectors": False
+        }
+        if filters:
+            data["filter"] = str(filters)  # Endee expects filter as string
+
+        try:
+            response = await _get_async_client().post(
+                f"{self.base_url}/api/v1/index/{collection_name}/search",
+                json=data, headers=self.headers)
+            response.raise_for_status()
+            if not response.content:
                 return []
+            if 'application/msgpack' in response.headers.get('content-type', ''):
+                result = msgpack.unpackb(response.content, raw=False,
+                                         use_list=False)
+            elif orjson is not None:
+                result = orjson.loads(response.content)
+            else:
+                result = response.json()
+            return self._extract_results(result)
         except Exception as e:
             logger.error(f"Search failed: {e}")
             return []
+
+    @staticmethod
+    def _extract_results(result) -> List:
+        """Normalize the search response shape to a sequence of results."""
+        if isinstance(result, (list, tuple)):
+            return result
+        elif isinstance(result, dict) and "results" in result:
+            return result["results"]
+        else:
+            return []
     
     def delete_collection(self, collection_name: str) -> bool:
         """Delete a collection."""